@@ -7,32 +7,122 @@ import os
 import re
 import json
 import sys
+import time
 import asyncio
-import requests
-from dotenv import load_dotenv
+import functools
+from collections import Counter
+import aiohttp
+from urllib.parse import quote
 import discord
 from discord import app_commands, Embed, Color
 from discord.ext import commands
-from openai import OpenAI
+from cache import (
+    make_cache_key, get_cached, set_cached, get_similar, add_similar, ttl_cache,
+    get_cached_response, set_cached_response
+)
 
-# Load environment variables
-load_dotenv()
+# Tokens and API keys are read from the environment (and .env, loaded at startup) when first needed
+def get_github_token():
+    """Return the optional GitHub token used for higher rate limits"""
+    return os.getenv("GITHUB_TOKEN")
 
-# Configure tokens and API keys
-DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+@functools.lru_cache(maxsize=1)
+def get_openai_client():
+    """Create the OpenAI client on first use, keeping the openai import off the startup path"""
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# LLM model used for analysis; bump PROMPT_VERSION whenever the prompt changes to invalidate cached analyses
+ANALYSIS_MODEL = "gpt-4o-mini"
+PROMPT_VERSION = "v2"
+
+# Embedding model for the semantic cache; input is capped to stay inside the model's token limit
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_MAX_CHARS = 24000
+
+# Minimum seconds between progress edits while streaming, and how much of the stream to show
+STREAM_UPDATE_INTERVAL = 1.5
+STREAM_PREVIEW_CHARS = 1900
+
+# Pre-compiled regex patterns
+_GITHUB_URL_RE = re.compile(r'github\.com/([^/]+)/([^/]+)')
+_GIT_SSH_RE = re.compile(r'github\.com:([^/]+)/([^/]+)\.git')
+
+# The "summary" string in a partially streamed JSON analysis, and a trailing incomplete \u escape
+_PARTIAL_SUMMARY_RE = re.compile(r'"summary"\s*:\s*"((?:[^"\\]|\\.)*)')
+_PARTIAL_ESCAPE_RE = re.compile(r'\\u[0-9a-fA-F]{0,3}$')
+
+# JSON keys for each rating in the LLM response, with their display labels
+_RATING_FIELDS = (
+    ("code_quality", "Code Quality"),
+    ("completeness", "Completeness"),
+    ("security", "Security"),
+    ("originality", "Originality"),
+    ("activity", "Activity")
+)
+
+# Star bars for ratings 0-5
+_STAR_BARS = ("☆☆☆☆☆", "★☆☆☆☆", "★★☆☆☆", "★★★☆☆", "★★★★☆", "★★★★★")
+
+# File extensions treated as code files
+CODE_EXTENSIONS = frozenset({
+    # Common programming languages
+    '.js', '.ts', '.jsx', '.tsx', '.py', '.rb', '.java', '.c', '.cpp', '.cs', '.go', '.rs', '.php',
+    '.swift', '.kt', '.scala', '.sh', '.bash', '.pl', '.lua', '.sol', '.ex', '.exs', '.erl', '.hrl',
+    # Smart contract languages
+    '.move', '.cairo', '.vy',
+    # Web files
+    '.html', '.css', '.scss', '.sass', '.less',
+    # Config files
+    '.json', '.yml', '.yaml', '.toml', '.xml', '.ini', '.env.example', '.gitignore',
+    # Documentation
+    '.md', '.txt'
+})
+
+# Skip files larger than 500KB, analyze at most 50 files and keep the first 1000 chars of each
+# to prevent token limit issues
+MAX_FILE_SIZE = 500000
+MAX_FILES_TO_ANALYZE = 50
+MAX_CONTENT_CHARS = 1000
+
+# Repositories with fewer files or fewer bytes (across all files) than this are judged structurally, without the LLM
+SKELETON_MAX_FILES = 3
+SKELETON_MAX_BYTES = 1024
+_SKELETON_SUMMARY_TEMPLATE = (
+    "The repository contains only {total_files} file(s) totalling {total_bytes} bytes, {code_files} of them code files. "
+    "That is far too little code to implement a functional project, so no detailed code review was performed."
+)
+_SKELETON_VERDICT = "LARPING - The repository is an empty or skeleton project with no substantial code behind it."
+
+# Limit concurrent GitHub requests per analysis to stay clear of secondary rate limits
+GITHUB_CONCURRENCY = 10
+
+class AnalyzerBot(commands.Bot):
+    """Discord bot that owns the shared GitHub HTTP session"""
+    http_session = None
+
+    async def close(self):
+        # Close the shared HTTP session on shutdown
+        if self.http_session and not self.http_session.closed:
+            await self.http_session.close()
+        await super().close()
 
 # Set up Discord bot
 intents = discord.Intents.default()
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot = AnalyzerBot(command_prefix="!", intents=intents)
+
+def create_http_session():
+    """Create the aiohttp session shared by all GitHub requests"""
+    github_token = get_github_token()
+    headers = {"Authorization": f"token {github_token}"} if github_token else {}
+    return aiohttp.ClientSession(headers=headers, connector=aiohttp.TCPConnector(limit=20))
 
 @bot.event
 async def on_ready():
     print(f'{bot.user.name} has connected to Discord!')
+    # on_ready fires again on reconnect, so only create the session once
+    if bot.http_session is None or bot.http_session.closed:
+        bot.http_session = create_http_session()
     try:
         synced = await bot.tree.sync()
         print(f"Synced {len(synced)} command(s)")
@@ -43,16 +133,31 @@ async def on_ready():
 async def slash_analyze(interaction: discord.Interaction, github_url: str):
     """Analyze a GitHub repository to check if it's legitimate or larping (slash command)"""
     # Check if the URL is a valid GitHub URL
-    if not re.search(r'github\.com/([^/]+)/([^/]+)', github_url):
+    if not _GITHUB_URL_RE.search(github_url):
         await interaction.response.send_message('Please provide a valid GitHub repository URL.', ephemeral=True)
         return
     
     # Send initial response (defer since analysis will take time)
     await interaction.response.defer(thinking=True)
     
+    # Show the tail of the LLM output in the deferred response while it streams in
+    progress_shown = False
+    
+    async def show_progress(text):
+        nonlocal progress_shown
+        try:
+            await interaction.edit_original_response(content=text[-STREAM_PREVIEW_CHARS:])
+            progress_shown = True
+        except discord.HTTPException as e:
+            print(f"Failed to update progress message: {e}")
+    
     try:
-        # Run the analysis in a separate thread to avoid blocking
-        result = await asyncio.to_thread(analyze_github_repo, github_url)
+        # Run the analysis on the event loop using the shared HTTP session
+        result = await analyze_github_repo(bot.http_session, github_url, on_progress=show_progress)
+        
+        # Replace the raw streamed text now that the formatted results are ready
+        if progress_shown:
+            await interaction.edit_original_response(content="✅ Analysis complete.")
         
         # Create and send the embed with results
         embeds = create_analysis_embeds(github_url, result)
@@ -67,12 +172,11 @@ def create_analysis_embeds(repo_url, result):
     repo_structure = result["repo_structure"]
     analysis_text = result["analysis"]
     
-    # Extract ratings if they exist in the analysis
-    ratings = extract_ratings(analysis_text)
+    # Extract ratings, verdict and summary if they exist in the analysis
+    ratings, verdict, summary = parse_analysis(analysis_text)
     
     # Determine the embed color based on the verdict
     color = Color.light_grey()
-    verdict = extract_verdict(analysis_text)
     if verdict:
         if "LEGITIMATE" in verdict.upper():
             color = Color.green()
@@ -121,8 +225,7 @@ def create_analysis_embeds(repo_url, result):
     if ratings:
         ratings_text = ""
         for k, v in ratings.items():
-            rating_value = v.split('/')[0]
-            stars = "★" * int(rating_value) + "☆" * (5 - int(rating_value))
+            stars = _STAR_BARS[int(v.partition('/')[0])]
             ratings_text += f"**{k}:** {stars} ({v})\n"
         
         main_embed.add_field(name="Ratings", value=ratings_text, inline=False)
@@ -133,14 +236,8 @@ def create_analysis_embeds(repo_url, result):
         color=color
     )
     
-    # Extract and format the analysis summary
-    summary = extract_summary(analysis_text)
-    
-    # Format the summary with proper markdown for Discord
-    formatted_summary = format_summary_for_discord(summary)
-    
     # Split the summary into chunks if it's too long for one embed
-    chunks = split_text_into_chunks(formatted_summary, 4000)  # Discord embed limit is 4096 chars
+    chunks = split_text_into_chunks(summary, 4000)  # Discord embed limit is 4096 chars
     
     summary_embed.description = chunks[0]
     
@@ -161,58 +258,46 @@ def create_analysis_embeds(repo_url, result):
     
     return embeds
 
-def extract_ratings(analysis_text):
-    """Extract ratings from the analysis text"""
-    ratings = {}
-    rating_patterns = [
-        (r"CODE QUALITY:\s*(\d+)/5", "Code Quality"),
-        (r"COMPLETENESS:\s*(\d+)/5", "Completeness"),
-        (r"SECURITY:\s*(\d+)/5", "Security"),
-        (r"ORIGINALITY:\s*(\d+)/5", "Originality"),
-        (r"ACTIVITY:\s*(\d+)/5", "Activity")
-    ]
+def extract_partial_summary(analysis_text):
+    """Return the part of the summary streamed so far, or None if it hasn't started"""
+    match = _PARTIAL_SUMMARY_RE.search(analysis_text)
+    if not match:
+        return None
     
-    for pattern, label in rating_patterns:
-        match = re.search(pattern, analysis_text, re.IGNORECASE)
-        if match:
-            ratings[label] = f"{match.group(1)}/5"
-    
-    return ratings
-
-def extract_verdict(analysis_text):
-    """Extract the verdict from the analysis text"""
-    verdict_match = re.search(r"VERDICT:?\s*(.+?)(?:\n|$)", analysis_text, re.IGNORECASE | re.DOTALL)
-    if verdict_match:
-        verdict = verdict_match.group(1).strip()
-        return verdict
-    return None
+    try:
+        return json.loads('"' + _PARTIAL_ESCAPE_RE.sub('', match.group(1)) + '"')
+    except json.JSONDecodeError:
+        return None
 
-def extract_summary(analysis_text):
-    """Extract the summary part of the analysis, excluding ratings and verdict"""
-    # Remove the ratings section
-    text = re.sub(r"(CODE QUALITY|COMPLETENESS|SECURITY|ORIGINALITY|ACTIVITY):\s*\d+/5", "", analysis_text)
-    
-    # Remove the verdict section
-    text = re.sub(r"VERDICT:?\s*.+?(?:\n|$)", "", text, flags=re.IGNORECASE | re.DOTALL)
-    
-    # Clean up and return
-    return "\n".join(line for line in text.split("\n") if line.strip())
+def is_complete_analysis(analysis_text):
+    """Check that the analysis is a JSON object, i.e. neither an error nor a cut-off completion"""
+    try:
+        return isinstance(json.loads(analysis_text), dict)
+    except json.JSONDecodeError:
+        return False
 
-def format_summary_for_discord(summary):
-    """Format the summary text for Discord's markdown"""
-    # Format section headers (like "Assessment" or "Key questions")
-    formatted = re.sub(r"#+\s+(.+)", r"**\1**", summary)
+def parse_analysis(analysis_text):
+    """Read the ratings, verdict and summary from the JSON analysis"""
+    try:
+        data = json.loads(analysis_text)
+    except json.JSONDecodeError:
+        data = None
     
-    # Format subsection headers (like a, b, c, d in your example)
-    formatted = re.sub(r"####\s+([a-z])\)\s+(.+)", r"**\1) \2**", formatted)
+    # Errors and any other non-JSON output are shown as the summary
+    if not isinstance(data, dict):
+        return {}, None, analysis_text
     
-    # Replace any HTML-like tags that might cause issues in Discord
-    formatted = re.sub(r"<[^>]+>", "", formatted)
+    ratings = {}
+    for key, label in _RATING_FIELDS:
+        try:
+            ratings[label] = f"{max(0, min(int(data[key]), 5))}/5"
+        except (KeyError, TypeError, ValueError):
+            continue
     
-    # Ensure proper spacing
-    formatted = formatted.replace("\n\n\n", "\n\n")
+    verdict = str(data.get("verdict") or "").strip() or None
+    summary = str(data.get("summary") or "")
     
-    return formatted
+    return ratings, verdict, summary
 
 def split_text_into_chunks(text, max_length):
     """Split text into chunks of maximum length, trying to split at paragraph breaks"""
@@ -220,26 +305,26 @@ def split_text_into_chunks(text, max_length):
         return [text]
     
     chunks = []
-    current_pos = 0
-    
-    while current_pos < len(text):
-        if current_pos + max_length >= len(text):
-            chunks.append(text[current_pos:])
-            break
-        
-        # Try to find a paragraph break
-        split_pos = text.rfind('\n\n', current_pos, current_pos + max_length)
+    current = []
+    current_len = 0
+    
+    # Greedily pack whole paragraphs into each chunk in a single pass
+    for paragraph in text.split('\n\n'):
+        if current and current_len + len(paragraph) + 2 > max_length:
+            chunks.append('\n\n'.join(current))
+            current = []
+            current_len = 0
         
-        if split_pos == -1 or split_pos <= current_pos:
-            # If no paragraph break, try to find a line break
-            split_pos = text.rfind('\n', current_pos, current_pos + max_length)
-            
-        if split_pos == -1 or split_pos <= current_pos:
-            # If no line break, just split at the max length
-            split_pos = current_pos + max_length
+        # A paragraph that can't fit in any chunk is split at the max length
+        while len(paragraph) > max_length:
+            chunks.append(paragraph[:max_length])
+            paragraph = paragraph[max_length:]
         
-        chunks.append(text[current_pos:split_pos])
-        current_pos = split_pos + 1
+        current.append(paragraph)
+        current_len += len(paragraph) + 2
+    
+    if current:
+        chunks.append('\n\n'.join(current))
     
     return chunks
 
@@ -250,12 +335,12 @@ def parse_github_url(url):
     try:
         # Handle different GitHub URL formats
         # Format: https://github.com/owner/repo
-        match = re.search(r'github\.com/([^/]+)/([^/]+)', url)
+        match = _GITHUB_URL_RE.search(url)
         if match:
             return match.group(1), match.group(2).replace('.git', '')
         
         # Format: git@github.com:owner/repo.git
-        match = re.search(r'github\.com:([^/]+)/([^/]+)\.git', url)
+        match = _GIT_SSH_RE.search(url)
         if match:
             return match.group(1), match.group(2)
         
@@ -264,55 +349,80 @@ def parse_github_url(url):
         print(f"Error parsing GitHub URL: {str(e)}")
         return None, None
 
-# Get repository information
-def get_repo_info(owner, repo):
-    try:
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-        response = requests.get(f"https://api.github.com/repos/{owner}/{repo}", headers=headers)
+# Fetch a GitHub API URL and decode the JSON body, revalidating previously seen URLs with the
+# ETag and Last-Modified date kept in the on-disk response cache (shared with the CLI)
+async def fetch_json(session, url):
+    cached = await asyncio.to_thread(get_cached_response, url)
+    headers = {}
+    if cached and cached[0]:
+        headers["If-None-Match"] = cached[0]
+    if cached and cached[1]:
+        headers["If-Modified-Since"] = cached[1]
+    
+    async with session.get(url, headers=headers) as response:
+        # 304 Not Modified has no body, so reuse the one stored with the validators
+        if response.status == 304 and cached:
+            return json.loads(cached[2])
+        
         response.raise_for_status()
-        return response.json()
+        text = await response.text()
+    
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if etag or last_modified:
+        await asyncio.to_thread(set_cached_response, url, etag, last_modified, text)
+    
+    return json.loads(text)
+
+# Get repository information, cached briefly across analyses
+@ttl_cache(maxsize=256, ttl=300)
+async def get_repo_info(session, owner, repo):
+    try:
+        return await fetch_json(session, f"https://api.github.com/repos/{owner}/{repo}")
     except Exception as e:
         print(f"Error fetching repository information: {str(e)}")
         raise
 
-# Get repository activity metrics (commits, contributors, etc.)
-def get_repo_activity(owner, repo):
-    try:
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-        
-        # Get commits (limited to last 100)
-        commits_url = f"https://api.github.com/repos/{owner}/{repo}/commits?per_page=100"
-        commits_response = requests.get(commits_url, headers=headers)
-        commits_response.raise_for_status()
-        commits = commits_response.json()
-        
-        # Get contributors
-        contributors_url = f"https://api.github.com/repos/{owner}/{repo}/contributors"
-        contributors_response = requests.get(contributors_url, headers=headers)
-        contributors_response.raise_for_status()
-        contributors = contributors_response.json()
-        
-        # Get issues
-        issues_url = f"https://api.github.com/repos/{owner}/{repo}/issues?state=all&per_page=100"
-        issues_response = requests.get(issues_url, headers=headers)
+# Fetch repository activity metrics (commits, contributors, etc.), cached briefly across analyses
+@ttl_cache(maxsize=256, ttl=300)
+async def fetch_repo_activity(session, owner, repo):
+    commits_url = f"https://api.github.com/repos/{owner}/{repo}/commits?per_page=100"  # Last 100 commits
+    contributors_url = f"https://api.github.com/repos/{owner}/{repo}/contributors"
+    issues_url = f"https://api.github.com/repos/{owner}/{repo}/issues?state=all&per_page=100"
+    
+    # The three endpoints are independent, so fetch them concurrently
+    commits, contributors, issues = await asyncio.gather(
+        fetch_json(session, commits_url),
+        fetch_json(session, contributors_url),
+        fetch_json(session, issues_url),
+        return_exceptions=True
+    )
+    if isinstance(commits, Exception):
+        raise commits
+    if isinstance(contributors, Exception):
+        raise contributors
+    if isinstance(issues, Exception):  # Some repos don't have issues enabled
         issues = []
-        if issues_response.status_code == 200:  # Some repos don't have issues enabled
-            issues = issues_response.json()
-        
-        # Calculate some metrics
-        commit_frequency = {}
-        for commit in commits:
-            if 'commit' in commit and 'author' in commit['commit'] and 'date' in commit['commit']['author']:
-                date = commit['commit']['author']['date'][:10]  # YYYY-MM-DD
-                commit_frequency[date] = commit_frequency.get(date, 0) + 1
-        
-        return {
-            "total_commits": len(commits),
-            "total_contributors": len(contributors),
-            "total_issues": len(issues),
-            "commit_dates": list(commit_frequency.keys()),
-            "recent_activity": len([d for d in commit_frequency.keys() if d >= "2024-01-01"]) > 0
-        }
+    
+    # Calculate some metrics
+    commit_frequency = {}
+    for commit in commits:
+        if 'commit' in commit and 'author' in commit['commit'] and 'date' in commit['commit']['author']:
+            date = commit['commit']['author']['date'][:10]  # YYYY-MM-DD
+            commit_frequency[date] = commit_frequency.get(date, 0) + 1
+    
+    return {
+        "total_commits": len(commits),
+        "total_contributors": len(contributors),
+        "total_issues": len(issues),
+        "commit_dates": list(commit_frequency.keys()),
+        "recent_activity": len([d for d in commit_frequency.keys() if d >= "2024-01-01"]) > 0
+    }
+
+# Get repository activity metrics, falling back to empty data on errors
+async def get_repo_activity(session, owner, repo):
+    try:
+        return await fetch_repo_activity(session, owner, repo)
     except Exception as e:
         print(f"Error fetching repository activity: {str(e)}")
         # Return empty data if we can't get activity info
@@ -324,127 +434,83 @@ def get_repo_activity(owner, repo):
             "recent_activity": False
         }
 
-# Get all files in the repository recursively
-def get_all_files(owner, repo, path=''):
-    try:
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-        response = requests.get(f"https://api.github.com/repos/{owner}/{repo}/contents/{path}", headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        files = []
-        
-        for item in data:
-            if item['type'] == 'file':
-                files.append(item)
-            elif item['type'] == 'dir':
-                sub_files = get_all_files(owner, repo, item['path'])
-                files.extend(sub_files)
-        
-        return files
-    except Exception as e:
-        print(f"Error fetching files from {path}: {str(e)}")
-        return []
+# Fetch all files in the repository with a single recursive Git Tree API call, cached briefly across analyses
+@ttl_cache(maxsize=256, ttl=300)
+async def fetch_file_tree(session, owner, repo, branch):
+    tree = await fetch_json(session, f"https://api.github.com/repos/{owner}/{repo}/git/trees/{quote(branch)}?recursive=1")
+    if tree.get('truncated'):
+        print("File tree was truncated by GitHub; analyzing the returned subset")
+    
+    return [
+        {
+            "path": item['path'],
+            "size": item['size'],
+            "download_url": f"https://raw.githubusercontent.com/{owner}/{repo}/{quote(branch)}/{quote(item['path'])}"
+        }
+        for item in tree['tree']
+        if item['type'] == 'blob'
+    ]
 
 # Determine if a file is a code file based on extension
 def is_code_file(file_path):
-    code_extensions = [
-        # Common programming languages
-        '.js', '.ts', '.jsx', '.tsx', '.py', '.rb', '.java', '.c', '.cpp', '.cs', '.go', '.rs', '.php',
-        '.swift', '.kt', '.scala', '.sh', '.bash', '.pl', '.lua', '.sol', '.ex', '.exs', '.erl', '.hrl',
-        # Web files
-        '.html', '.css', '.scss', '.sass', '.less',
-        # Config files
-        '.json', '.yml', '.yaml', '.toml', '.xml', '.ini', '.env.example', '.gitignore',
-        # Documentation
-        '.md', '.txt'
-    ]
-    
-    _, extension = os.path.splitext(file_path.lower())
-    return extension in code_extensions
+    return os.path.splitext(file_path)[1].lower() in CODE_EXTENSIONS
 
 # Analyze repository structure
 def analyze_repo_structure(files):
-    file_types = {}
-    directory_structure = {}
-    
-    for file in files:
-        # Count file types
-        _, extension = os.path.splitext(file['path'].lower())
-        file_types[extension] = file_types.get(extension, 0) + 1
-        
-        # Build directory structure
-        parts = file['path'].split('/')
-        current = directory_structure
-        
-        for i in range(len(parts) - 1):
-            part = parts[i]
-            if part not in current:
-                current[part] = {}
-            current = current[part]
+    # Count file types
+    file_types = Counter(os.path.splitext(file['path'])[1].lower() for file in files)
     
     return {
         "file_types": file_types,
-        "total_files": len(files),
-        "directory_structure": directory_structure
+        "total_files": len(files)
     }
 
+# Fetch the content of a single file
+async def fetch_file_content(session, semaphore, file):
+    try:
+        async with semaphore:
+            async with session.get(file['download_url']) as response:
+                response.raise_for_status()
+                content = await response.text() or ""
+        
+        # Only the start of each file goes into the prompt, so don't keep the full body around
+        return {
+            "path": file['path'],
+            "content": content[:MAX_CONTENT_CHARS] + ("...[truncated]" if len(content) > MAX_CONTENT_CHARS else ""),
+            "size": file['size'],
+            "full_len": len(content)
+        }
+    except Exception as e:
+        print(f"Error fetching content for {file['path']}: {str(e)}")
+        return {
+            "path": file['path'],
+            "content": "Error fetching content",
+            "error": str(e),
+            "size": file['size']
+        }
+
 # Get code contents for files
-def get_code_contents(owner, repo, files):
-    code_contents = []
-    
+async def get_code_contents(session, owner, repo, files):
     # We need to limit the number of files to analyze to avoid rate limits and excessive processing
-    files_to_analyze = files[:50]  # Limit to 50 files
+    files_to_analyze = files[:MAX_FILES_TO_ANALYZE]
     
-    for file in files_to_analyze:
-        try:
-            # Skip large files
-            if file['size'] > 500000:  # Skip files larger than 500KB
-                code_contents.append({
-                    "path": file['path'],
-                    "content": "File too large to analyze",
-                    "size": file['size']
-                })
-                continue
-            
-            headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-            response = requests.get(file['download_url'], headers=headers)
-            response.raise_for_status()
-            
-            content = response.text if response.text else json.dumps(response.json())
-            
-            code_contents.append({
-                "path": file['path'],
-                "content": content,
-                "size": file['size']
-            })
-        except Exception as e:
-            print(f"Error fetching content for {file['path']}: {str(e)}")
-            code_contents.append({
-                "path": file['path'],
-                "content": "Error fetching content",
-                "error": str(e),
-                "size": file['size']
-            })
-    
-    return code_contents
+    semaphore = asyncio.Semaphore(GITHUB_CONCURRENCY)
+    return list(await asyncio.gather(*(fetch_file_content(session, semaphore, file) for file in files_to_analyze)))
+
+# Embed the analysis prompt for semantic cache lookups
+async def get_prompt_embedding(prompt):
+    try:
+        response = await get_openai_client().embeddings.create(model=EMBEDDING_MODEL, input=prompt[:EMBEDDING_MAX_CHARS])
+        return response.data[0].embedding
+    except Exception as e:
+        print(f"Error embedding prompt: {str(e)}")
+        return None
 
 # Analyze code with LLM
-def analyze_code_with_llm(repo_info, repo_structure, repo_activity, code_contents):
+async def analyze_code_with_llm(repo_info, repo_structure, repo_activity, code_contents, on_progress=None):
     try:
-        # Create a simplified representation of the code for analysis
-        code_overview = [
-            {
-                "path": file["path"],
-                "size": file["size"],
-                # Only include first 1000 chars for the prompt to prevent token limit issues
-                "content": file["content"][:1000] + ("...[truncated]" if len(file["content"]) > 1000 else "")
-            }
-            for file in code_contents
-        ]
-        
         # Create the prompt for the LLM
-        prompt = f"""
+        header = f"""
 Analyze this cryptocurrency/blockchain GitHub repository to determine if the project is "larping" (pretending to be more substantial than it actually is).
 
 REPOSITORY OVERVIEW:
@@ -459,34 +525,42 @@ REPOSITORY OVERVIEW:
 - Recent activity: {'Yes' if repo_activity['recent_activity'] else 'No'}
 
 ANALYSIS INSTRUCTIONS:
-1. Provide a concise assessment (max 500 words total) focused on these key questions:
+Respond with a JSON object containing exactly these keys:
+- "summary": A concise assessment (max 500 words total) focused on these key questions:
    a) Is this a real, functional project or just empty promises?
    b) Does the code actually implement what the project claims?
    c) Are there specific red flags indicating a scam or incompetence?
    d) Is this a copy/paste of another project with minimal modifications?
-
-2. Rate each of the following on a scale of 1-5 (1=Very Poor, 5=Excellent):
-   - CODE QUALITY: Is the code well-written or amateurish?
-   - COMPLETENESS: Is it a complete implementation or just a skeleton?
-   - SECURITY: Are there obvious security flaws?
-   - ORIGINALITY: Is this unique code or copied/forked?
-   - ACTIVITY: Is this an actively maintained project?
-
-3. VERDICT: Explicitly state whether this project is LEGITIMATE or LARPING, with a 1-2 sentence explanation.
+- Integer ratings on a scale of 1-5 (1=Very Poor, 5=Excellent):
+   - "code_quality": Is the code well-written or amateurish?
+   - "completeness": Is it a complete implementation or just a skeleton?
+   - "security": Are there obvious security flaws?
+   - "originality": Is this unique code or copied/forked?
+   - "activity": Is this an actively maintained project?
+- "verdict": Start with LEGITIMATE or LARPING, followed by a 1-2 sentence explanation.
 
 Here are excerpts from key files:
 
 """
         
-        for file in code_overview:
-            prompt += f"""
---- {file['path']} ---
-{file['content']}
-"""
+        # Join the file excerpts in one pass rather than growing the prompt string
+        parts = [header]
+        parts.extend(f"\n--- {file['path']} ---\n{file['content']}\n" for file in code_contents)
+        prompt = "".join(parts)
         
-        # Call the OpenAI API for analysis
-        response = openai_client.chat.completions.create(
-            model="gpt-4-turbo",  # Use the most capable model
+        # Serve a cached analysis of a near-identical prompt for the same repository
+        namespace = f"{PROMPT_VERSION}:{repo_info['full_name']}"
+        embedding = await get_prompt_embedding(prompt)
+        if embedding:
+            # Decoding and comparing stored embeddings is CPU-bound, so it runs in a worker thread
+            cached_analysis = await asyncio.to_thread(get_similar, namespace, embedding)
+            if cached_analysis:
+                print("Using semantically cached analysis")
+                return cached_analysis
+        
+        # Call the OpenAI API for analysis, streaming tokens so progress can be shown early
+        stream = await get_openai_client().chat.completions.create(
+            model=ANALYSIS_MODEL,
             messages=[
                 {
                     "role": "system",
@@ -498,17 +572,38 @@ Here are excerpts from key files:
                 }
             ],
             temperature=0.2,  # Lower temperature for more consistent analysis
-            max_tokens=2000  # Reduced token count for concise output
+            max_tokens=2000,  # Reduced token count for concise output
+            response_format={"type": "json_object"},
+            stream=True
         )
-
-        return response.choices[0].message.content
+        
+        pieces = []
+        last_update = time.monotonic()
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            pieces.append(chunk.choices[0].delta.content)
+            
+            if on_progress and time.monotonic() - last_update >= STREAM_UPDATE_INTERVAL:
+                last_update = time.monotonic()
+                # Show the summary being written rather than the raw JSON
+                summary = extract_partial_summary("".join(pieces))
+                if summary:
+                    await on_progress(summary)
+        
+        analysis = "".join(pieces)
+        # A completion cut off at max_tokens is invalid JSON and mustn't be served to later requests
+        if embedding and is_complete_analysis(analysis):
+            await asyncio.to_thread(add_similar, namespace, embedding, analysis)
+        
+        return analysis
         
     except Exception as e:
         print(f"Error analyzing code with LLM: {str(e)}")
         return f"Error analyzing code with LLM: {str(e)}"
 
 # Main function to analyze a GitHub repository
-def analyze_github_repo(repo_url):
+async def analyze_github_repo(session, repo_url, on_progress=None):
     try:
         print(f"Starting analysis of repository: {repo_url}")
         
@@ -518,34 +613,84 @@ def analyze_github_repo(repo_url):
             raise ValueError("Invalid GitHub repository URL")
         
         # Get repository information
-        repo_info = get_repo_info(owner, repo)
+        repo_info = await get_repo_info(session, owner, repo)
         print(f"Repository: {repo_info['name']}")
         print(f"Description: {repo_info.get('description', 'No description')}")
         print(f"Stars: {repo_info['stargazers_count']}")
         print(f"Forks: {repo_info['forks_count']}")
         print(f"Last updated: {repo_info['updated_at']}")
         
-        # Get all files recursively
-        files = get_all_files(owner, repo)
+        # Return a cached analysis if nothing has been pushed since it was produced
+        cache_key = make_cache_key(f"{owner}/{repo}@{repo_info['pushed_at']}|{ANALYSIS_MODEL}|{PROMPT_VERSION}")
+        # SQLite calls run in a worker thread so they don't block the event loop
+        cached = await asyncio.to_thread(get_cached, cache_key)
+        if cached:
+            print("Using cached analysis")
+            return {
+                "repo_info": repo_info,
+                "repo_structure": cached["repo_structure"],
+                "analysis": cached["analysis"],
+                "verdict_source": "cache"
+            }
+        
+        # Get all files in the repository. Errors aren't swallowed here, since an empty file list
+        # would make a real repository look like a skeleton. GitHub answers 409 for a repository
+        # with no commits (its size field can't be used, as it is 0 until GitHub computes it)
+        try:
+            files = await fetch_file_tree(session, owner, repo, repo_info['default_branch'])
+        except aiohttp.ClientResponseError as e:
+            if e.status != 409:
+                raise
+            files = []
         print(f"Found {len(files)} files in the repository")
         
         # Analyze repository structure
         repo_structure = analyze_repo_structure(files)
         
+        # Drop non-code and oversized files before any download
+        code_files = [
+            file for file in files
+            if is_code_file(file['path']) and file['size'] <= MAX_FILE_SIZE
+        ]
+        # Every file counts towards the size, so code in languages outside CODE_EXTENSIONS isn't missed
+        total_bytes = sum(file['size'] for file in files)
+        
+        # Skeleton repositories get a structural verdict without fetching content or calling the LLM
+        if repo_structure['total_files'] < SKELETON_MAX_FILES or total_bytes < SKELETON_MAX_BYTES:
+            print("Repository is a skeleton; skipping LLM analysis (verdict_source=structural)")
+            return {
+                "repo_info": repo_info,
+                "repo_structure": repo_structure,
+                "analysis": json.dumps({
+                    "completeness": 1,
+                    "verdict": _SKELETON_VERDICT,
+                    "summary": _SKELETON_SUMMARY_TEMPLATE.format(
+                        total_files=repo_structure['total_files'],
+                        total_bytes=total_bytes,
+                        code_files=len(code_files)
+                    )
+                }),
+                "verdict_source": "structural"
+            }
+        
         # Get repository activity metrics
-        repo_activity = get_repo_activity(owner, repo)
+        repo_activity = await get_repo_activity(session, owner, repo)
         
         # Get code content for relevant files
-        code_files = [file for file in files if is_code_file(file['path'])]
-        code_contents = get_code_contents(owner, repo, code_files)
+        code_contents = await get_code_contents(session, owner, repo, code_files[:MAX_FILES_TO_ANALYZE])
         
         # Analyze code with LLM
-        analysis = analyze_code_with_llm(repo_info, repo_structure, repo_activity, code_contents)
+        analysis = await analyze_code_with_llm(repo_info, repo_structure, repo_activity, code_contents, on_progress)
+        
+        # Don't cache failed or cut-off LLM calls so the next request retries
+        if is_complete_analysis(analysis):
+            await asyncio.to_thread(set_cached, cache_key, {"repo_structure": repo_structure, "analysis": analysis})
         
         return {
             "repo_info": repo_info,
             "repo_structure": repo_structure,
-            "analysis": analysis
+            "analysis": analysis,
+            "verdict_source": "llm"
         }
     except Exception as e:
         print(f"Error analyzing repository: {str(e)}")
@@ -553,9 +698,14 @@ def analyze_github_repo(repo_url):
 
 # Run the bot
 if __name__ == "__main__":
+    # Load environment variables
+    from dotenv import load_dotenv
+    load_dotenv()
+    
     # Check if Discord token is available
-    if not DISCORD_TOKEN:
+    discord_token = os.getenv("DISCORD_TOKEN")
+    if not discord_token:
         print("Error: DISCORD_TOKEN is not set in the .env file")
         sys.exit(1)
     
-    bot.run(DISCORD_TOKEN)
\ No newline at end of file
+    bot.run(discord_token)
\ No newline at end of file
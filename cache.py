@@ -0,0 +1,188 @@
+# Caches for repository analyses
+# Stores JSON-serializable results and raw GitHub responses in a local SQLite database,
+# plus a short-lived in-memory cache for GitHub metadata
+
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import closing
+
+# Cache location and default time-to-live (7 days)
+CACHE_PATH = ".analysis_cache.sqlite3"
+CACHE_TTL = 7 * 24 * 60 * 60
+
+# Minimum cosine similarity for a semantic cache hit
+SIMILARITY_THRESHOLD = 0.92
+
+# GitHub responses younger than this (15 minutes) are served without revalidation
+RESPONSE_CACHE_TTL = 15 * 60
+
+# The schema is created (and migrated) once per process, guarded for the CLI's worker threads
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def _create_schema(connection):
+    """Create the cache tables and add columns missing from older databases"""
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS analyses (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS semantic_analyses "
+        "(namespace TEXT NOT NULL, embedding TEXT NOT NULL, response TEXT NOT NULL, created_at REAL NOT NULL)"
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS semantic_analyses_namespace ON semantic_analyses (namespace)"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS analyses_created_at ON analyses (created_at)")
+    connection.execute("CREATE INDEX IF NOT EXISTS semantic_analyses_created_at ON semantic_analyses (created_at)")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS responses "
+        "(url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body TEXT NOT NULL, fetched_at REAL NOT NULL)"
+    )
+    connection.execute("CREATE INDEX IF NOT EXISTS responses_fetched_at ON responses (fetched_at)")
+    # Databases created before last_modified was stored need the column added
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(responses)")]
+    if "last_modified" not in columns:
+        connection.execute("ALTER TABLE responses ADD COLUMN last_modified TEXT")
+
+def _connect():
+    """Open the cache database, setting up its tables on the first connection"""
+    global _schema_ready
+    connection = sqlite3.connect(CACHE_PATH)
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                try:
+                    _create_schema(connection)
+                except sqlite3.Error:
+                    connection.close()
+                    raise
+                _schema_ready = True
+    return connection
+
+def make_cache_key(text):
+    """Hash the text describing a request into a cache key"""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def get_cached(key, ttl=CACHE_TTL):
+    """Return the cached value for key, or None if missing or older than ttl seconds"""
+    try:
+        with closing(_connect()) as connection, connection:
+            row = connection.execute("SELECT value, created_at FROM analyses WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as e:
+        print(f"Error reading analysis cache: {str(e)}")
+        return None
+
+    if row is None or time.time() - row[1] > ttl:
+        return None
+    return json.loads(row[0])
+
+def set_cached(key, value):
+    """Store value under key, replacing any previous entry and deleting expired ones"""
+    try:
+        with closing(_connect()) as connection, connection:
+            now = time.time()
+            connection.execute("DELETE FROM analyses WHERE created_at < ?", (now - CACHE_TTL,))
+            connection.execute(
+                "INSERT OR REPLACE INTO analyses (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now)
+            )
+    except sqlite3.Error as e:
+        print(f"Error writing analysis cache: {str(e)}")
+
+def cosine_similarity(a, b):
+    """Cosine similarity of two equal-length vectors"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+def get_similar(namespace, embedding, threshold=SIMILARITY_THRESHOLD, ttl=CACHE_TTL):
+    """Return the freshest cached response in namespace whose embedding is at least threshold-similar, or None"""
+    try:
+        with closing(_connect()) as connection, connection:
+            rows = connection.execute(
+                "SELECT embedding, response FROM semantic_analyses WHERE namespace = ? AND created_at >= ? "
+                "ORDER BY created_at DESC",
+                (namespace, time.time() - ttl)
+            ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Error reading semantic cache: {str(e)}")
+        return None
+
+    best_response, best_similarity = None, threshold
+    for stored_embedding, response in rows:
+        similarity = cosine_similarity(embedding, json.loads(stored_embedding))
+        if similarity >= best_similarity:
+            best_response, best_similarity = response, similarity
+    return best_response
+
+def add_similar(namespace, embedding, response):
+    """Store a response with the embedding of the prompt that produced it, deleting expired entries"""
+    try:
+        with closing(_connect()) as connection, connection:
+            now = time.time()
+            connection.execute("DELETE FROM semantic_analyses WHERE created_at < ?", (now - CACHE_TTL,))
+            connection.execute(
+                "INSERT INTO semantic_analyses (namespace, embedding, response, created_at) VALUES (?, ?, ?, ?)",
+                (namespace, json.dumps(embedding), response, now)
+            )
+    except sqlite3.Error as e:
+        print(f"Error writing semantic cache: {str(e)}")
+
+def ttl_cache(maxsize=256, ttl=300):
+    """Cache an async function's results in memory for ttl seconds
+
+    The first argument (the HTTP session) is ignored when building the key. Calls that
+    raise are not cached, so errors such as 404 or 401 are retried on the next call.
+    """
+    def decorator(fn):
+        entries = OrderedDict()
+
+        @functools.wraps(fn)
+        async def wrapper(session, *args):
+            entry = entries.get(args)
+            if entry and entry[1] > time.monotonic():
+                entries.move_to_end(args)
+                return entry[0]
+
+            value = await fn(session, *args)
+            entries[args] = (value, time.monotonic() + ttl)
+            entries.move_to_end(args)
+            while len(entries) > maxsize:
+                entries.popitem(last=False)
+            return value
+
+        wrapper.cache_clear = entries.clear
+        return wrapper
+    return decorator
+
+def get_cached_response(url):
+    """Return the cached (etag, last_modified, body, fetched_at) for url, or None"""
+    try:
+        with closing(_connect()) as connection, connection:
+            return connection.execute(
+                "SELECT etag, last_modified, body, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Error reading response cache: {str(e)}")
+        return None
+
+def set_cached_response(url, etag, last_modified, body):
+    """Store the response body for url along with its ETag and Last-Modified validators,
+    deleting responses that haven't been fetched or revalidated within CACHE_TTL
+    """
+    try:
+        with closing(_connect()) as connection, connection:
+            now = time.time()
+            connection.execute("DELETE FROM responses WHERE fetched_at < ?", (now - CACHE_TTL,))
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, body, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, body, now)
+            )
+    except sqlite3.Error as e:
+        print(f"Error writing response cache: {str(e)}")
@@ -4,24 +4,110 @@
 
 import os
 import re
-import json
 import sys
+import time
+import functools
+import itertools
+import orjson
 import requests
-from dotenv import load_dotenv
-from openai import OpenAI
+from collections import Counter
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import quote, urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from cache import RESPONSE_CACHE_TTL, get_cached_response, set_cached_response
 
-# Load environment variables
-load_dotenv()
+# Tokens and API keys are read from the environment (and .env, loaded in main) when first needed
+def get_github_token():
+    """Return the optional GitHub token used for higher rate limits"""
+    return os.getenv("GITHUB_TOKEN")
 
-# Configure GitHub API token and OpenAI API key
-GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+@functools.lru_cache(maxsize=1)
+def get_openai_client():
+    """Create the OpenAI client on first use, keeping the openai import off the startup path"""
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# A smaller model triages every repository first; the larger model is only called when the
+# triage rates its confidence in the verdict (1-5) below TRIAGE_MIN_CONFIDENCE
+TRIAGE_MODEL = "gpt-4o-mini"
+ANALYSIS_MODEL = "gpt-4-turbo"
+TRIAGE_MIN_CONFIDENCE = 4
+
+# Matches both GitHub URL formats in one pass:
+# https://github.com/owner/repo and git@github.com:owner/repo.git
+_GITHUB_URL_RE = re.compile(r'github\.com[/:]([^/]+)/([^/]+)')
+
+# The confidence rating the triage model is asked to start its answer with, markup and
+# punctuation at the start of a line, and a letter (to tell text from leftover markup)
+_CONFIDENCE_RE = re.compile(r'CONFIDENCE:\s*([1-5])(?:\s*/\s*5)?')
+_LEADING_MARKUP_RE = re.compile(r'^\W+')
+_LETTER_RE = re.compile(r'[^\W\d_]')
+
+# File extensions treated as code files
+CODE_EXTENSIONS = frozenset({
+    # Common programming languages
+    '.js', '.ts', '.jsx', '.tsx', '.py', '.rb', '.java', '.c', '.cpp', '.cs', '.go', '.rs', '.php',
+    '.swift', '.kt', '.scala', '.sh', '.bash', '.pl', '.lua', '.sol', '.ex', '.exs', '.erl', '.hrl',
+    # Smart contract languages
+    '.move', '.cairo', '.vy',
+    # Web files
+    '.html', '.css', '.scss', '.sass', '.less',
+    # Config files
+    '.json', '.yml', '.yaml', '.toml', '.xml', '.ini', '.env.example', '.gitignore',
+    # Documentation
+    '.md', '.txt'
+})
+
+# Skip files larger than 500KB, analyze at most 50 files and at most 5 from any one directory
+MAX_FILE_SIZE = 500000
+MAX_FILES_TO_ANALYZE = 50
+MAX_FILES_PER_DIRECTORY = 5
+
+# Characters of each file included in the prompt, and bytes downloaded per file
+# (enough to fill the excerpt and still tell whether the file was truncated)
+MAX_CONTENT_CHARS = 1000
+FILE_PREVIEW_BYTES = 2048
+
+# A repository counts as recently active if it has a commit within this many days
+RECENT_ACTIVITY_DAYS = 180
+
+# Verdict for repositories with no commits, given without fetching activity or contents or calling the LLM
+EMPTY_REPO_VERDICT = "VERDICT: LARPING - The repository is empty (it has no commits), so there is no code behind the project."
+
+# Hints for ranking which files best show whether the project is real
+SOURCE_DIRECTORIES = frozenset({'src', 'contracts', 'programs', 'lib', 'app', 'core', 'pkg', 'cmd'})
+VENDORED_DIRECTORIES = frozenset({'node_modules', 'vendor', 'dist', 'build', 'out', 'target', '.github'})
+SOURCE_EXTENSIONS = frozenset({
+    '.sol', '.rs', '.py', '.go', '.ts', '.tsx', '.js', '.jsx', '.java', '.c', '.cpp', '.cs',
+    '.rb', '.php', '.swift', '.kt', '.scala', '.ex', '.exs', '.erl', '.move', '.cairo', '.vy'
+})
+LOCK_FILES = frozenset({'package-lock.json', 'pnpm-lock.yaml', 'npm-shrinkwrap.json', 'composer.lock'})
+
+# Shared HTTP session so GitHub connections are pooled and kept alive across requests
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504], raise_on_status=False)
+)
+SESSION.mount("https://api.github.com", _adapter)
+SESSION.mount("https://raw.githubusercontent.com", _adapter)
+SESSION.headers.update({"Accept": "application/vnd.github+json"})
+
+# Add the GitHub token to each request as it is sent, since .env isn't loaded until main runs
+def _github_auth(request):
+    token = get_github_token()
+    if token:
+        request.headers["Authorization"] = f"token {token}"
+    return request
+
+SESSION.auth = _github_auth
 
 # Main function to analyze a GitHub repository
-def analyze_github_repo(repo_url):
+# on_text receives the LLM analysis piece by piece as it is streamed
+def analyze_github_repo(repo_url, on_text=None):
     try:
         print(f"Starting analysis of repository: {repo_url}")
         
@@ -30,35 +116,50 @@ def analyze_github_repo(repo_url):
         if not owner or not repo:
             raise ValueError("Invalid GitHub repository URL")
         
-        # Get repository information
-        repo_info = get_repo_info(owner, repo)
+        # Get repository information first, so missing repositories fail fast
+        # before any of the other requests are made
+        try:
+            repo_info = get_repo_info(owner, repo)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 404:
+                raise ValueError(f"Repository {owner}/{repo} not found (it may be private or deleted)") from e
+            raise
         print(f"Repository: {repo_info['name']}")
         print(f"Description: {repo_info.get('description', 'No description')}")
         print(f"Stars: {repo_info['stargazers_count']}")
         print(f"Forks: {repo_info['forks_count']}")
         print(f"Last updated: {repo_info['updated_at']}")
         
-        # Get all files recursively
+        # Get all files in the repository. Empty repositories get a verdict without further analysis;
+        # this is detected from the tree because the size field is 0 until GitHub has computed it
         files = get_all_files(owner, repo)
+        if files is None:
+            print("Repository is empty; skipping analysis (verdict_source=structural)")
+            return {
+                "repo_info": repo_info,
+                "repo_structure": analyze_repo_structure([])[0],
+                "analysis": EMPTY_REPO_VERDICT,
+                "verdict_source": "structural"
+            }
         print(f"Found {len(files)} files in the repository")
         
-        # Analyze repository structure
-        repo_structure = analyze_repo_structure(files)
-        
-        # Get repository activity metrics
-        repo_activity = get_repo_activity(owner, repo)
+        # Analyze repository structure and find the code files
+        repo_structure, code_files = analyze_repo_structure(files)
         
-        # Get code content for relevant files
-        code_files = [file for file in files if is_code_file(file['path'])]
-        code_contents = get_code_contents(owner, repo, code_files)
+        # Activity metrics and code contents are independent, so fetch them concurrently
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            repo_activity_future = executor.submit(get_repo_activity, owner, repo)
+            code_contents = get_code_contents(owner, repo, code_files)
+            repo_activity = repo_activity_future.result()
         
         # Analyze code with LLM
-        analysis = analyze_code_with_llm(repo_info, repo_structure, repo_activity, code_contents)
+        analysis = analyze_code_with_llm(repo_info, repo_structure, repo_activity, code_contents, on_text)
         
         return {
             "repo_info": repo_info,
             "repo_structure": repo_structure,
-            "analysis": analysis
+            "analysis": analysis,
+            "verdict_source": "llm"
         }
     except Exception as e:
         print(f"Error analyzing repository: {str(e)}")
@@ -67,29 +168,62 @@ def analyze_github_repo(repo_url):
 # Parse GitHub URL to extract owner and repo name
 def parse_github_url(url):
     try:
-        # Handle different GitHub URL formats
-        # Format: https://github.com/owner/repo
-        match = re.search(r'github\.com/([^/]+)/([^/]+)', url)
-        if match:
-            return match.group(1), match.group(2).replace('.git', '')
-        
-        # Format: git@github.com:owner/repo.git
-        match = re.search(r'github\.com:([^/]+)/([^/]+)\.git', url)
+        match = _GITHUB_URL_RE.search(url)
         if match:
-            return match.group(1), match.group(2)
+            return match.group(1), match.group(2).removesuffix('.git')
         
         return None, None
     except Exception as e:
         print(f"Error parsing GitHub URL: {str(e)}")
         return None, None
 
+# Fetch a GitHub URL through the on-disk response cache
+# Fresh entries are served directly; stale ones are revalidated with their ETag and Last-Modified
+# date, and GitHub doesn't count 304 Not Modified responses against the rate limit.
+# extract turns the response into the text that is returned and cached (the body by default)
+# headers are sent with the request; the cache is keyed by URL alone, so callers must always pass the same ones
+def github_get(url, extract=None, headers=None):
+    cached = get_cached_response(url)
+    if cached:
+        etag, last_modified, body, fetched_at = cached
+        if time.time() - fetched_at < RESPONSE_CACHE_TTL:
+            return body
+    
+    headers = dict(headers or {})
+    if cached and etag:
+        headers["If-None-Match"] = etag
+    if cached and last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = SESSION.get(url, headers=headers)
+    if response.status_code == 304 and cached:
+        set_cached_response(url, etag, last_modified, body)  # Restart the TTL
+        return body
+    
+    response.raise_for_status()
+    body = extract(response) if extract else response.text
+    set_cached_response(url, response.headers.get("ETag"), response.headers.get("Last-Modified"), body)
+    return body
+
+# Fetch a GitHub API URL through the response cache and decode the JSON body
+def github_get_json(url):
+    return orjson.loads(github_get(url))
+
+# Count the items in a paginated GitHub list fetched with per_page=1
+def count_items(response):
+    # With one item per page, the number of the last page is the total count
+    last_url = response.links.get('last', {}).get('url')
+    if last_url:
+        return int(parse_qs(urlparse(last_url).query)['page'][0])
+    return len(response.json()) if response.text else 0
+
+# Get the total number of items in a paginated GitHub list with a single request
+def github_count(url):
+    return int(github_get(url, extract=lambda response: str(count_items(response))))
+
 # Get repository information
 def get_repo_info(owner, repo):
     try:
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-        response = requests.get(f"https://api.github.com/repos/{owner}/{repo}", headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return github_get_json(f"https://api.github.com/repos/{owner}/{repo}")
     except Exception as e:
         print(f"Error fetching repository information: {str(e)}")
         raise
@@ -97,40 +231,41 @@ def get_repo_info(owner, repo):
 # Get repository activity metrics (commits, contributors, etc.)
 def get_repo_activity(owner, repo):
     try:
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
+        base_url = f"https://api.github.com/repos/{owner}/{repo}"
         
-        # Get commits (limited to last 100)
-        commits_url = f"https://api.github.com/repos/{owner}/{repo}/commits?per_page=100"
-        commits_response = requests.get(commits_url, headers=headers)
-        commits_response.raise_for_status()
-        commits = commits_response.json()
+        # The requests are independent, so make them concurrently. Totals come from the
+        # pagination links, and the last 100 commits provide the commit dates
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            commits_future = executor.submit(github_get_json, f"{base_url}/commits?per_page=100")
+            total_commits_future = executor.submit(github_count, f"{base_url}/commits?per_page=1")
+            total_contributors_future = executor.submit(github_count, f"{base_url}/contributors?per_page=1")
+            total_issues_future = executor.submit(github_count, f"{base_url}/issues?state=all&per_page=1")
         
-        # Get contributors
-        contributors_url = f"https://api.github.com/repos/{owner}/{repo}/contributors"
-        contributors_response = requests.get(contributors_url, headers=headers)
-        contributors_response.raise_for_status()
-        contributors = contributors_response.json()
+        commits = commits_future.result()
+        total_commits = total_commits_future.result()
+        total_contributors = total_contributors_future.result()
         
-        # Get issues
-        issues_url = f"https://api.github.com/repos/{owner}/{repo}/issues?state=all&per_page=100"
-        issues_response = requests.get(issues_url, headers=headers)
-        issues = []
-        if issues_response.status_code == 200:  # Some repos don't have issues enabled
-            issues = issues_response.json()
+        try:
+            total_issues = total_issues_future.result()
+        except Exception:  # Some repos don't have issues enabled
+            total_issues = 0
         
-        # Calculate some metrics
-        commit_frequency = {}
+        # Calculate some metrics, counting commits per day and checking for recent ones in the same pass
+        commit_frequency = Counter()
+        recent_activity = False
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=RECENT_ACTIVITY_DAYS)).strftime("%Y-%m-%d")
         for commit in commits:
             if 'commit' in commit and 'author' in commit['commit'] and 'date' in commit['commit']['author']:
                 date = commit['commit']['author']['date'][:10]  # YYYY-MM-DD
-                commit_frequency[date] = commit_frequency.get(date, 0) + 1
+                commit_frequency[date] += 1
+                recent_activity = recent_activity or date >= cutoff
         
         return {
-            "total_commits": len(commits),
-            "total_contributors": len(contributors),
-            "total_issues": len(issues),
-            "commit_dates": list(commit_frequency.keys()),
-            "recent_activity": len([d for d in commit_frequency.keys() if d >= "2024-01-01"]) > 0
+            "total_commits": total_commits,
+            "total_contributors": total_contributors,
+            "total_issues": total_issues,
+            "commit_dates": list(commit_frequency),
+            "recent_activity": recent_activity
         }
     except Exception as e:
         print(f"Error fetching repository activity: {str(e)}")
@@ -143,127 +278,232 @@ def get_repo_activity(owner, repo):
             "recent_activity": False
         }
 
-# Get all files in the repository recursively
-def get_all_files(owner, repo, path=''):
+# Get all files in the repository with a single recursive Git Tree API call
+# Returns None if the repository has no commits (GitHub answers 409 for its tree)
+def get_all_files(owner, repo):
     try:
-        headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-        response = requests.get(f"https://api.github.com/repos/{owner}/{repo}/contents/{path}", headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        files = []
+        # HEAD resolves to the default branch, so this doesn't have to wait for the repository info
+        tree = github_get_json(f"https://api.github.com/repos/{owner}/{repo}/git/trees/HEAD?recursive=1")
         
-        for item in data:
-            if item['type'] == 'file':
-                files.append(item)
-            elif item['type'] == 'dir':
-                sub_files = get_all_files(owner, repo, item['path'])
-                files.extend(sub_files)
+        if tree.get('truncated'):
+            print("File tree is too large for a single request, listing directories instead")
+            return get_all_files_by_directory(owner, repo)
         
-        return files
+        return [
+            {
+                "path": item['path'],
+                "size": item['size'],
+                "download_url": f"https://raw.githubusercontent.com/{owner}/{repo}/HEAD/{quote(item['path'])}"
+            }
+            for item in tree['tree']
+            if item['type'] == 'blob'
+        ]
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 409:
+            return None
+        print(f"Error fetching file tree: {str(e)}")
+        return []
+    except Exception as e:
+        print(f"Error fetching file tree: {str(e)}")
+        return []
+
+# List the contents of a single repository directory
+def get_directory_contents(owner, repo, path=''):
+    try:
+        return github_get_json(f"https://api.github.com/repos/{owner}/{repo}/contents/{path}")
     except Exception as e:
         print(f"Error fetching files from {path}: {str(e)}")
         return []
 
-# Determine if a file is a code file based on extension
-def is_code_file(file_path):
-    code_extensions = [
-        # Common programming languages
-        '.js', '.ts', '.jsx', '.tsx', '.py', '.rb', '.java', '.c', '.cpp', '.cs', '.go', '.rs', '.php',
-        '.swift', '.kt', '.scala', '.sh', '.bash', '.pl', '.lua', '.sol', '.ex', '.exs', '.erl', '.hrl',
-        # Web files
-        '.html', '.css', '.scss', '.sass', '.less',
-        # Config files
-        '.json', '.yml', '.yaml', '.toml', '.xml', '.ini', '.env.example', '.gitignore',
-        # Documentation
-        '.md', '.txt'
-    ]
+# Get all files by walking the contents API, listing each level of directories concurrently
+def get_all_files_by_directory(owner, repo):
+    files = []
+    pending_dirs = ['']
+    
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        while pending_dirs:
+            listings = list(executor.map(lambda path: get_directory_contents(owner, repo, path), pending_dirs))
+            pending_dirs = []
+            
+            for data in listings:
+                for item in data:
+                    if item['type'] == 'file':
+                        files.append(item)
+                    elif item['type'] == 'dir':
+                        pending_dirs.append(item['path'])
     
-    _, extension = os.path.splitext(file_path.lower())
-    return extension in code_extensions
+    return files
 
-# Analyze repository structure
+# Analyze repository structure and pick out the code files in the same pass
 def analyze_repo_structure(files):
-    file_types = {}
-    directory_structure = {}
+    file_types = Counter()
+    code_files = []
     
     for file in files:
         # Count file types
         _, extension = os.path.splitext(file['path'].lower())
-        file_types[extension] = file_types.get(extension, 0) + 1
+        file_types[extension] += 1
         
-        # Build directory structure
-        parts = file['path'].split('/')
-        current = directory_structure
-        
-        for i in range(len(parts) - 1):
-            part = parts[i]
-            if part not in current:
-                current[part] = {}
-            current = current[part]
+        # Collect code files
+        if extension in CODE_EXTENSIONS:
+            code_files.append(file)
     
-    return {
+    structure = {
         "file_types": file_types,
-        "total_files": len(files),
-        "directory_structure": directory_structure
+        "total_files": len(files)
     }
+    return structure, code_files
 
-# Get code contents for files
-def get_code_contents(owner, repo, files):
+# Score how much a file is likely to reveal about the project (higher is better)
+def score_file(file):
+    parts = file['path'].lower().split('/')
+    name = parts[-1]
+    directories = parts[:-1]
+    score = 0
+    
+    if os.path.splitext(name)[1] in SOURCE_EXTENSIONS:
+        score += 2
+    if SOURCE_DIRECTORIES.intersection(directories):
+        score += 2
+    # Entry points and the top-level README (which states what the project claims to be)
+    if name in ('lib.rs', 'main.rs') or (not directories and (name.startswith('main.') or name.startswith('readme'))):
+        score += 3
+    # Generated, vendored and lock files say little about the project's own code
+    if name.endswith('.min.js') or name in LOCK_FILES or VENDORED_DIRECTORIES.intersection(directories):
+        score -= 10
+    
+    return score
+
+# Pick the most informative files, spreading the budget across directories
+def select_files_to_analyze(files):
+    selected = []
+    overflow = []
+    per_directory = Counter()
+    
+    # sorted is stable, so equally scored files keep their tree order
+    for score, file in sorted(((score_file(file), file) for file in files), key=lambda item: item[0], reverse=True):
+        directory = file['path'].rpartition('/')[0]
+        if score >= 0 and per_directory[directory] < MAX_FILES_PER_DIRECTORY:
+            per_directory[directory] += 1
+            selected.append(file)
+        else:
+            overflow.append(file)
+    
+    # Only fall back to low-signal files and files over the per-directory cap if there aren't enough others
+    return (selected + overflow)[:MAX_FILES_TO_ANALYZE]
+
+# Fetch the content of a single file
+def fetch_file_content(file):
+    try:
+        # Only the start of each file goes into the prompt, so ask for just the first bytes
+        # (answered with 206 Partial Content, or 200 if the server ignores the range).
+        # Empty files can't satisfy a range (the server answers 416), so they aren't requested
+        if file['size'] == 0:
+            content = ""
+        else:
+            content = github_get(file['download_url'], headers={"Range": f"bytes=0-{FILE_PREVIEW_BYTES - 1}"})
+        
+        # Keep only the excerpt used in the prompt. Multibyte text can decode to fewer characters
+        # than the excerpt holds, so files larger than the downloaded range count as truncated too
+        return {
+            "path": file['path'],
+            "content": content[:MAX_CONTENT_CHARS],
+            "truncated": file['size'] > FILE_PREVIEW_BYTES or len(content) > MAX_CONTENT_CHARS,
+            "size": file['size']
+        }
+    except Exception as e:
+        print(f"Error fetching content for {file['path']}: {str(e)}")
+        return {
+            "path": file['path'],
+            "content": "Error fetching content",
+            "truncated": False,
+            "error": str(e),
+            "size": file['size']
+        }
+
+# Fetch the contents of many files in a single GraphQL request (requires a GitHub token)
+def fetch_file_contents_graphql(owner, repo, files):
+    # Each file is an aliased Blob lookup; paths are passed as variables so they need no escaping
+    variables = {"owner": owner, "name": repo}
+    declarations = ["$owner: String!", "$name: String!"]
+    fields = []
+    for i, file in enumerate(files):
+        variables[f"e{i}"] = f"HEAD:{file['path']}"
+        declarations.append(f"$e{i}: String!")
+        fields.append(f"f{i}: object(expression: $e{i}) {{ ... on Blob {{ text isBinary byteSize }} }}")
+    
+    query = f"query({', '.join(declarations)}) {{ repository(owner: $owner, name: $name) {{ {' '.join(fields)} }} }}"
+    response = SESSION.post("https://api.github.com/graphql", json={"query": query, "variables": variables})
+    response.raise_for_status()
+    result = orjson.loads(response.content)
+    if result.get('errors'):
+        raise RuntimeError(result['errors'][0].get('message', 'GraphQL query failed'))
+    
     code_contents = []
+    repository = result['data']['repository']
+    for i, file in enumerate(files):
+        blob = repository.get(f"f{i}")
+        # Skip missing and binary blobs
+        if not blob or blob['isBinary']:
+            continue
+        
+        text = blob['text'] or ""
+        code_contents.append({
+            "path": file['path'],
+            "content": text[:MAX_CONTENT_CHARS],
+            "truncated": len(text) > MAX_CONTENT_CHARS,
+            "size": blob['byteSize']
+        })
     
-    # We need to limit the number of files to analyze to avoid rate limits and excessive processing
-    files_to_analyze = files[:50]  # Limit to 50 files
+    return code_contents
+
+# Get code contents for files
+def get_code_contents(owner, repo, files):
+    # We need to limit the number of files to analyze to avoid rate limits and excessive processing.
+    # Large files are dropped before any request so they don't use up the budget
+    files_to_analyze = select_files_to_analyze([file for file in files if file['size'] <= MAX_FILE_SIZE])
     
-    for file in files_to_analyze:
+    # With a token, GraphQL returns every file in one request instead of one request per file
+    if get_github_token() and files_to_analyze:
         try:
-            # Skip large files
-            if file['size'] > 500000:  # Skip files larger than 500KB
-                code_contents.append({
-                    "path": file['path'],
-                    "content": "File too large to analyze",
-                    "size": file['size']
-                })
-                continue
-            
-            headers = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
-            response = requests.get(file['download_url'], headers=headers)
-            response.raise_for_status()
-            
-            content = response.text if response.text else json.dumps(response.json())
-            
-            code_contents.append({
-                "path": file['path'],
-                "content": content,
-                "size": file['size']
-            })
+            return fetch_file_contents_graphql(owner, repo, files_to_analyze)
         except Exception as e:
-            print(f"Error fetching content for {file['path']}: {str(e)}")
-            code_contents.append({
-                "path": file['path'],
-                "content": "Error fetching content",
-                "error": str(e),
-                "size": file['size']
-            })
+            print(f"Error fetching file contents with GraphQL, downloading files individually: {str(e)}")
     
-    return code_contents
+    # Otherwise download files in parallel; map preserves the input order of the files
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        return list(executor.map(fetch_file_content, files_to_analyze))
 
-# Analyze code with LLM
-def analyze_code_with_llm(repo_info, repo_structure, repo_activity, code_contents):
-    try:
-        # Create a simplified representation of the code for analysis
-        code_overview = [
+# Start a streamed chat completion for the analysis prompt
+def stream_completion(model, prompt):
+    return get_openai_client().chat.completions.create(
+        model=model,
+        messages=[
+            {
+                "role": "system",
+                "content": "You are a senior blockchain security expert conducting due diligence on cryptocurrency projects. Your task is to analyze GitHub repositories to determine if they contain legitimate code or are 'larping' (pretending to be more substantial than they are). Be brutally honest and concise in your assessment."
+            },
             {
-                "path": file["path"],
-                "size": file["size"],
-                # Only include first 1000 chars for the prompt to prevent token limit issues
-                "content": file["content"][:1000] + ("...[truncated]" if len(file["content"]) > 1000 else "")
+                "role": "user",
+                "content": prompt
             }
-            for file in code_contents
-        ]
-        
+        ],
+        temperature=0.2,  # Lower temperature for more consistent analysis
+        max_tokens=2000,  # Reduced token count for concise output
+        stream=True
+    )
+
+# Yield the text of each chunk in a completion stream
+def stream_text(stream):
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+# Analyze code with LLM, passing each piece of the answer to on_text as it arrives
+def analyze_code_with_llm(repo_info, repo_structure, repo_activity, code_contents, on_text=None):
+    try:
         # Create the prompt for the LLM
-        prompt = f"""
+        header = f"""
 Analyze this cryptocurrency/blockchain GitHub repository to determine if the project is "larping" (pretending to be more substantial than it actually is).
 
 REPOSITORY OVERVIEW:
@@ -272,7 +512,7 @@ REPOSITORY OVERVIEW:
 - Stars: {repo_info['stargazers_count']}
 - Forks: {repo_info['forks_count']}
 - Total files: {repo_structure['total_files']}
-- File types: {json.dumps(repo_structure['file_types'])}
+- File types: {orjson.dumps(repo_structure['file_types']).decode()}
 - Total commits: {repo_activity['total_commits']}
 - Total contributors: {repo_activity['total_contributors']}
 - Recent activity: {'Yes' if repo_activity['recent_activity'] else 'No'}
@@ -297,30 +537,60 @@ Here are excerpts from key files:
 
 """
         
-        for file in code_overview:
-            prompt += f"""
---- {file['path']} ---
-{file['content']}
-"""
+        # Join the file excerpts in one pass rather than growing the prompt string
+        parts = [header]
+        parts.extend(
+            f"\n--- {file['path']} ---\n{file['content']}{'...[truncated]' if file['truncated'] else ''}\n"
+            for file in code_contents
+        )
+        prompt = "".join(parts)
         
-        # Call the OpenAI API for analysis
-        response = openai_client.chat.completions.create(
-            model="gpt-4-turbo",  # Use the most capable model
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a senior blockchain security expert conducting due diligence on cryptocurrency projects. Your task is to analyze GitHub repositories to determine if they contain legitimate code or are 'larping' (pretending to be more substantial than they are). Be brutally honest and concise in your assessment."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.2,  # Lower temperature for more consistent analysis
-            max_tokens=2000  # Reduced token count for concise output
+        # Triage with the smaller model, reading its answer up to the confidence line
+        triage_stream = stream_completion(
+            TRIAGE_MODEL,
+            prompt + '\nStart your answer with a line of the form "CONFIDENCE: N", where N (1-5) is how confident you are in the verdict. Use 5 only when the evidence is unambiguous, for example when there is little or no real code.\n'
         )
-
-        return response.choices[0].message.content
+        triage = stream_text(triage_stream)
+        head = ""
+        for text in triage:
+            head += text
+            match = _CONFIDENCE_RE.search(head)
+            if "\n" in (head[match.end():] if match else head):
+                break
+        
+        match = _CONFIDENCE_RE.search(head)
+        confident = match is not None and int(match.group(1)) >= TRIAGE_MIN_CONFIDENCE
+        
+        # The analysis starts after the rating: on the same line if that has text rather than
+        # just markup such as "**", otherwise on the next line or in a later chunk
+        first = ""
+        if confident:
+            rating_rest, newline, following = head[match.end():].partition("\n")
+            if _LETTER_RE.search(rating_rest):
+                first = _LEADING_MARKUP_RE.sub("", rating_rest) + newline + following
+            else:
+                first = following.lstrip()
+        while confident and not first:
+            text = next(triage, None)
+            if text is None:
+                break
+            first = text.lstrip()
+        
+        if first:
+            pieces_stream = itertools.chain([first], triage)
+        else:
+            # Not confident enough (or no analysis followed the rating), so stop the triage
+            # and stream the larger model's analysis instead
+            triage_stream.close()
+            pieces_stream = stream_text(stream_completion(ANALYSIS_MODEL, prompt))
+        
+        pieces = []
+        for text in pieces_stream:
+            pieces.append(text)
+            if on_text and text:
+                on_text(text)
+        
+        return "".join(pieces)
         
     except Exception as e:
         print(f"Error analyzing code with LLM: {str(e)}")
@@ -332,12 +602,31 @@ def main():
         print("Usage: python github_analyzer.py <github-repo-url>")
         sys.exit(1)
     
+    # Load environment variables
+    from dotenv import load_dotenv
+    load_dotenv()
+    
     repo_url = sys.argv[1]
+    streaming = False
+    
+    # Print the analysis as it is streamed, after the header
+    def show(text):
+        nonlocal streaming
+        if not streaming:
+            streaming = True
+            print("\n--- REPOSITORY ANALYSIS ---\n")
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    
     try:
-        result = analyze_github_repo(repo_url)
+        result = analyze_github_repo(repo_url, on_text=show)
         
-        print("\n--- REPOSITORY ANALYSIS ---\n")
-        print(result["analysis"])
+        if streaming:
+            print()
+        else:
+            # Nothing was streamed, e.g. because the LLM call failed
+            print("\n--- REPOSITORY ANALYSIS ---\n")
+            print(result["analysis"])
         
     except Exception as e:
         print(f"Analysis failed: {str(e)}")